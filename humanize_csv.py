@@ -19,20 +19,33 @@ input file.
 
 import csv
 import argparse
+import functools
+import io
+import mmap
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+import pandas
 from sdmx_metadata import SDMXMetadata
 
+# Buffer size used for writing files
+BUFFER_SIZE = 1 << 20
+
 PARSER = argparse.ArgumentParser(
     description='Humanize a CSV file by filling in its values.')
 PARSER.add_argument('input_file',
-                    type=argparse.FileType('r'),
                     help='a CSV file generated from an SDMX data file')
-
-ARGS = PARSER.parse_args()
-INPUT_FILE = ARGS.input_file
+PARSER.add_argument('-v', '--verbose', action='store_true',
+                    help='print diagnostic output')
 
 GEOGRAPHY_CODE = 'Geography code'
 
+# Approximate number of bytes of input translated by each worker task
+CHUNK_BYTES = 16 << 20
+
+# Translation state for the file being humanized, set in each worker process
+WORKER_STATE = {}
+
 def initialize():
     """
     Given the input file passed in to the script, parse its name and generate
@@ -41,59 +54,138 @@ def initialize():
 
     catalog_extractor = re.compile(r'.*/Generic_(.*)\.csv')
     try:
-        catalog_num = catalog_extractor.findall(INPUT_FILE.name)[0]
+        catalog_num = catalog_extractor.findall(INPUT_FILE_NAME)[0]
     except IndexError:
         raise LookupError(
             'Could not find catalogue number. '
             'The file name must be of the pattern "Generic_CATALOG-NUM.csv".'
         )
 
-    print(catalog_num)
+    if ARGS.verbose:
+        print(catalog_num)
 
-    structure_file_name = INPUT_FILE.name \
+    structure_file_name = INPUT_FILE_NAME \
                                     .replace('Generic', 'Structure') \
                                     .replace('csv', 'xml')
 
-    print(structure_file_name)
+    if ARGS.verbose:
+        print(structure_file_name)
 
-    output_file_name = INPUT_FILE.name.replace('.csv', '.humanized.csv')
+    output_file_name = INPUT_FILE_NAME.replace('.csv', '.humanized.csv')
 
     return (structure_file_name, output_file_name)
 
 
-def rebuild_csv(sdmx_metadata, input_file, output_file_name):
+def split_ranges(input_file_name, start):
     """
-    Generate the new CSV, with the humanized column titles and values.
+    Split the input file, from the byte offset start, into (start, end) byte
+    ranges of about CHUNK_BYTES that each end on a line boundary. The input is
+    generated by sdmx_to_csv.py, so its values never contain line breaks.
     """
+    ranges = []
+    with open(input_file_name, 'rb') as input_file:
+        size = os.fstat(input_file.fileno()).st_size
+        if start >= size:
+            return ranges
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            while start < size:
+                end = data.find(b'\n', start + CHUNK_BYTES)
+                end = size if end == -1 else end + 1
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def init_worker(header, dtypes, translations):
+    """ Store the translation state for the file in a worker process. """
+    WORKER_STATE['header'] = header
+    WORKER_STATE['dtypes'] = dtypes
+    WORKER_STATE['translations'] = translations
+
+
+def translate_range(input_file_name, byte_range):
+    """
+    Translate the rows in the given byte range of the input file, returning
+    them as CSV text.
+    """
+    start, end = byte_range
+    with open(input_file_name, 'rb') as input_file:
+        input_file.seek(start)
+        data = input_file.read(end - start)
+
+    # na_filter=False stops pandas from turning empty values or values such
+    # as "NA" into missing data.
+    chunk = pandas.read_csv(io.BytesIO(data), header=None,
+                            names=WORKER_STATE['header'],
+                            dtype=WORKER_STATE['dtypes'], na_filter=False)
+
+    # Retain the geography code
+    geography = chunk['GEO'] if 'GEO' in chunk else ''
+
+    # Values without a matching code level are kept as they are. Mapping a
+    # categorical applies the function to its categories only.
+    for code, levels in WORKER_STATE['translations'].items():
+        chunk[code] = chunk[code].map(
+            lambda value, levels=levels: levels.get(value, value))
+
+    chunk.insert(0, GEOGRAPHY_CODE, geography)
+    # Use the csv module's line endings, as the header and sdmx_to_csv.py do
+    return chunk.to_csv(header=False, index=False, lineterminator='\r\n')
+
+
+def rebuild_csv(sdmx_metadata, input_file_name, output_file_name):
+    """
+    Generate the new CSV, with the humanized column titles and values. The
+    rows are split into ranges that are translated in parallel by worker
+    processes, and written out in their original order.
+    """
+
+    name_by_code = sdmx_metadata.name_by_code
+    is_primary_measure_code = sdmx_metadata.is_primary_measure_code
+    code_levels = sdmx_metadata.code_levels()
 
-    dict_reader = csv.DictReader(input_file)
+    with open(input_file_name, 'rb') as binary_input_file:
+        header_line = binary_input_file.readline()
+        data_start = binary_input_file.tell()
+    header = next(csv.reader([header_line.decode()]))
 
     # First, transform fieldnames
-    fieldnames = [
-        sdmx_metadata.name_by_code(x)
-        for x in list(dict_reader.fieldnames)
-    ]
+    fieldnames = [name_by_code(x) for x in header]
     fieldnames.insert(0, GEOGRAPHY_CODE)
 
-    # Now, iterate through the input file, transform using a dictionary
-    # comprehension, and write to the output file.
-    with open(output_file_name, 'w') as output_file:
-        dict_writer = csv.DictWriter(output_file, fieldnames=fieldnames)
-        dict_writer.writeheader()
-
-        for line in dict_reader:
-            new_line = {
-                sdmx_metadata.name_by_code(k):
-                sdmx_metadata.description_by_code_level(k, v)
-                for k, v in line.items()
-            }
-            # Retain the geography code
-            if 'GEO' in line:
-                new_line[GEOGRAPHY_CODE] = line['GEO']
-            print(new_line)
-            dict_writer.writerow(new_line)
-
-
-STRUCTURE_FILE_NAME, OUTPUT_FILE_NAME = initialize()
-SDMX_METADATA = SDMXMetadata(STRUCTURE_FILE_NAME)
-rebuild_csv(SDMX_METADATA, INPUT_FILE, OUTPUT_FILE_NAME)
+    # Find the columns whose values need translating. The primary measure is
+    # passed through untouched.
+    translations = {
+        x: code_levels[x]
+        for x in header
+        if x in code_levels and not is_primary_measure_code(x)
+    }
+
+    # Columns with a code list are read as categoricals, so the parser stores
+    # each distinct code level once and the translation only runs once per
+    # distinct level, rather than once per cell. Everything else is read as a
+    # plain string.
+    dtypes = {x: 'category' if x in translations else str for x in header}
+
+    ranges = split_ranges(input_file_name, data_start)
+
+    with open(output_file_name, 'w', newline='',
+              buffering=BUFFER_SIZE) as output_file:
+        csv.writer(output_file).writerow(fieldnames)
+
+        with ProcessPoolExecutor(
+                max_workers=os.cpu_count(), initializer=init_worker,
+                initargs=(header, dtypes, translations)) as executor:
+            for text in executor.map(
+                    functools.partial(translate_range, input_file_name),
+                    ranges):
+                output_file.write(text)
+
+
+if __name__ == '__main__':
+    ARGS = PARSER.parse_args()
+    INPUT_FILE_NAME = ARGS.input_file
+
+    STRUCTURE_FILE_NAME, OUTPUT_FILE_NAME = initialize()
+    SDMX_METADATA = SDMXMetadata(STRUCTURE_FILE_NAME)
+    rebuild_csv(SDMX_METADATA, INPUT_FILE_NAME, OUTPUT_FILE_NAME)
@@ -6,49 +6,68 @@ some libraries which expect wide data; for most data analysis, especially in
 pandas or R, data should be put back into the Tidy format.
 """
 
-import pandas
+import polars
 import numpy
 import csv
 import argparse
+import functools
+import re
 
 PARSER = argparse.ArgumentParser(
     description='Reshape a CSV file from tall (Tidy) to wide format')
 PARSER.add_argument('input_file',
-                    type=argparse.FileType('r'),
                     help='a CSV file to reshape')
 
 ARGS = PARSER.parse_args()
-INPUT_FILE = ARGS.input_file
+INPUT_FILE_NAME = ARGS.input_file
 
-OUTPUT_FILE_NAME = INPUT_FILE.name.replace('.csv', '.pivoted.csv')
+OUTPUT_FILE_NAME = INPUT_FILE_NAME.replace('.csv', '.pivoted.csv')
 
+# Temporary column numbering the wide column each row goes to
+PIVOT_KEY = '__pivot_key__'
+
+# Dollar signs are removed from column names first, since that can create a
+# new "total - " for the substitutions that follow.
+DOLLAR_PATTERN = re.compile(r' \(\$\)|\$')
+RENAME_REPLACEMENTS = {
+    'total - ': 'all-',
+    ' ': '-',
+    ',': '',
+}
+RENAME_PATTERN = re.compile(
+    '|'.join(re.escape(x) for x in RENAME_REPLACEMENTS))
+
+@functools.lru_cache(maxsize=None)
 def rename_column(column):
-    column = str(column).strip().lower()
-    column = column.replace(' ($)', '')
-    column = column.replace('$', '')
-    column = column.replace('total - ', 'all-')
-    column = column.replace(' ', '-')
-    column = column.replace(',', '')
-    return column
+    column = DOLLAR_PATTERN.sub('', str(column).strip().lower())
+    return RENAME_PATTERN.sub(
+        lambda match: RENAME_REPLACEMENTS[match.group(0)], column)
 
 
 def load_data():
-    data = pandas.read_csv(INPUT_FILE)
+    # Read every column as a string; types guessed from the first rows break on
+    # codes or values that only change shape further down the file. The value
+    # column is converted to a number below.
+    data = polars.read_csv(INPUT_FILE_NAME, infer_schema=False)
 
     # Remove 2005 data, if applicable
-    # if 'Year (2)' in data:
-    #     data = data[(data['Year (2)'] == 2015)]
-    #     data = data.drop('Year (2)', 1)
+    # if 'Year (2)' in data.columns:
+    #     data = data.filter(polars.col('Year (2)') == 2015)
+    #     data = data.drop('Year (2)')
 
     # Drop observation missing status if it's there
-    if 'Observation missing status' in data:
-        data = data.drop('Observation missing status', 1)
+    if 'Observation missing status' in data.columns:
+        data = data.drop('Observation missing status')
 
-    # Convert the first column to string, so it sorts better
-    data.ix[:, 0] = data.ix[:, 0].apply(str)
+    second_column = data.columns[1]
+    value_column = data.columns[-1]
 
-    # Trim the whitespace in the second column
-    data.ix[:, 1] = data.ix[:, 1].map(str.strip)
+    data = data.with_columns(
+        # Trim the whitespace in the second column
+        polars.col(second_column).str.strip_chars(),
+        # The last column holds the observed values
+        polars.col(value_column).cast(polars.Float64),
+    )
 
     print(data.head())
 
@@ -57,31 +76,52 @@ def load_data():
 def pivot_data(data):
     # We assume the first item in the list is the index, and the last is the value.
     # All the ones in the middle are the pivot columns.
-    all_columns = list(data)
+    all_columns = data.columns
     index_columns = all_columns[0:2]
     pivot_columns = all_columns[2:-1]
     value_column = all_columns[-1]
 
-    # Build the pivot table
-    pivoted = data.pivot_table(
-        index=index_columns, columns=pivot_columns, values=value_column)
+    # As pivot_table did, leave out rows with a missing key or value.
+    data = data.drop_nulls(index_columns + pivot_columns + [value_column])
 
-    pivoted.columns = ['_'.join(col).strip() for col in [
-        tuple(rename_column(column) for column in column_list)
-        for column_list in pivoted.columns.values
-    ]]
+    # Number each distinct combination of pivot values, in sorted order, and
+    # pivot on that number, so that every combination gets its own column.
+    combinations = data.select(pivot_columns).unique().sort(pivot_columns) \
+                       .with_row_index(PIVOT_KEY)
+    data = data.join(combinations, on=pivot_columns).sort(PIVOT_KEY)
 
-    # Rename the index columns
-    pivoted.index.names = [rename_column(column) for column in pivoted.index.names]
+    # Build the pivot table. An (index, pivot) combination that occurs more than
+    # once keeps its first value; report how many values that leaves out.
+    dropped = data.height - data.select(index_columns + [PIVOT_KEY]).n_unique()
+    if dropped:
+        print('Warning: %d rows repeat an earlier (index, pivot) combination; '
+              'only the first value of each was kept.' % dropped)
+    pivoted = data.pivot(on=PIVOT_KEY, index=index_columns, values=value_column,
+                         aggregate_function='first')
 
     # Sort by the index columns
-    pivoted = pivoted.sort_index()
-
-    return pivoted
-
-def to_csv(data):
-    data.to_csv(OUTPUT_FILE_NAME)
+    pivoted = pivoted.sort(index_columns)
+
+    # Name the index columns, and the wide columns after their renamed pivot
+    # values joined with '_'. As with pivot_table, different combinations may
+    # end up with the same name, so the names are kept apart from the frame.
+    wide_names = {
+        str(key): '_'.join(rename_column(value) for value in values)
+        for key, *values in combinations.iter_rows()
+    }
+    fieldnames = [rename_column(column) for column in index_columns]
+    fieldnames += [
+        wide_names[column] for column in pivoted.columns[len(index_columns):]
+    ]
+
+    return pivoted, fieldnames
+
+def to_csv(data, fieldnames):
+    # The header is written separately, since two columns may share a name
+    with open(OUTPUT_FILE_NAME, 'w', newline='') as output_file:
+        csv.writer(output_file, lineterminator='\n').writerow(fieldnames)
+        data.write_csv(output_file, include_header=False)
 
 DATA = load_data()
-PIVOTED_DATA = pivot_data(DATA)
-to_csv(PIVOTED_DATA)
\ No newline at end of file
+PIVOTED_DATA, PIVOTED_FIELDNAMES = pivot_data(DATA)
+to_csv(PIVOTED_DATA, PIVOTED_FIELDNAMES)
\ No newline at end of file
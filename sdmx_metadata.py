@@ -2,8 +2,8 @@
 Loads and parses the Structure SDMX file at the given path.
 """
 
-import pprint
-import xml.etree.cElementTree as cElementTree
+import functools
+from lxml import etree
 
 class SDMXMetadata:
     """
@@ -19,6 +19,10 @@ class SDMXMetadata:
         self.__load_primary_measure()
         self.__load_concepts()
         self.__load_code_levels()
+        # The same (code, code level) pairs recur on every row of a dataset.
+        # Only code list lookups are cached, not observation values.
+        self.__cached_description = functools.lru_cache(maxsize=None)(
+            self.__description_by_code_level)
 
     @staticmethod
     def __remove_xml_namespace(tag_name):
@@ -32,11 +36,19 @@ class SDMXMetadata:
 
     def __load_xml(self, sdmx_structure_file_path):
         """
-        NB. Strips the namespaces!
+        NB. Strips the namespaces! Also indexes the Concept and CodeList
+        elements by id, so they can be looked up without searching the tree.
         """
-        iterator = cElementTree.iterparse(sdmx_structure_file_path)
+        self.__concepts_by_id = {}
+        self.__codelists_by_id = {}
+        iterator = etree.iterparse(sdmx_structure_file_path,
+                                   remove_blank_text=True)
         for _, element in iterator:
             element.tag = self.__remove_xml_namespace(element.tag)
+            if element.tag == 'Concept':
+                self.__concepts_by_id.setdefault(element.attrib.get('id'), element)
+            elif element.tag == 'CodeList':
+                self.__codelists_by_id.setdefault(element.attrib.get('id'), element)
         return iterator.root
 
     def __load_primary_measure(self):
@@ -71,13 +83,10 @@ class SDMXMetadata:
 
         # Next, find the concept names
         for code in self.__concept_codes:
-            name = self.__root.find('.//Concept[@id="%s"]' % code).find('Name').text
+            name = self.__concepts_by_id[code].find('Name').text
             self.__concept_code_to_name[code] = name
             self.__name_to_concept_code[name] = code
 
-        pprint.pprint(self.__concept_codes)
-        pprint.pprint(self.__concept_code_to_name)
-
     def __load_code_levels(self):
         """
         Load the concept code lists (mapping variable numbers, e.g. 1, 2, and 3
@@ -86,9 +95,8 @@ class SDMXMetadata:
         self.__code_levels = {}
 
         for codelist_key in self.__concept_codelist_keys:
-            print('>>> codelist_key', codelist_key)
-            code_list = self.__root.find('.//CodeList[@id="%s"]' % codelist_key)
-            if code_list:  # Sometimes there are codes without code lists.
+            code_list = self.__codelists_by_id.get(codelist_key)
+            if code_list is not None:  # Sometimes there are codes without code lists.
 
                 # When storing the code lists, we actually want to store them
                 # in a dict with a key of concept code, not CL_CONCEPT_CODE.
@@ -101,8 +109,6 @@ class SDMXMetadata:
                     code_description = level.find('Description').text
                     self.__code_levels[concept_code][code_value] = code_description
 
-        pprint.pprint(self.__code_levels)
-
     def is_primary_measure_code(self, code):
         """ Is this the primary measure code? """
         return code == self.__primary_measure_code
@@ -143,6 +149,13 @@ class SDMXMetadata:
             return code_level
         if self.is_primary_measure_code(code):
             return code_level
+        return self.__cached_description(code, code_level, trim)
+
+    def __description_by_code_level(self, code, code_level, trim):
+        """
+        Look up the description for a given code level. Memoized per instance;
+        see description_by_code_level.
+        """
         description = self.__code_levels[code][code_level]
         if trim:
             description = description.strip()
@@ -7,21 +7,29 @@ the SDMX file -- which is to say, not very human-readable. See the other scripts
 in this folder to build human-readable CSV files.
 """
 
-import xml.etree.cElementTree as cElementTree
 import csv
 import argparse
-from collections import OrderedDict
+from sys import intern
+from lxml import etree
+
+# Buffer size used for reading and writing files
+BUFFER_SIZE = 1 << 20
 
 PARSER = argparse.ArgumentParser(description='Process an SDMX file to CSV.')
-PARSER.add_argument('input_file', type=argparse.FileType('r'),
+PARSER.add_argument('input_file',
+                    type=argparse.FileType('rb', bufsize=BUFFER_SIZE),
                     help='a Census Canada SDMX data file')
+PARSER.add_argument('-v', '--verbose', action='store_true',
+                    help='print diagnostic output')
 
 ARGS = PARSER.parse_args()
 
 INPUT_FILE = ARGS.input_file
 OUTPUT_FILE_NAME = INPUT_FILE.name.replace('.xml', '.csv')
 
-ORDERED_KEY_DICT = OrderedDict()
+# The CSV columns, in the order their concepts first appear
+FIELDNAMES = []
+SEEN_FIELDNAMES = set()
 
 def remove_xml_namespace(tag_name):
     """
@@ -33,52 +41,90 @@ def remove_xml_namespace(tag_name):
     return tag_name
 
 
-def append_row(row_array, row, value):
-    """ Append a row to the row_array. """
-    row['OBS_VALUE'] = value
-    row_array.append(row)
-    print(row)
+def clear_element(elem):
+    """
+    Clear a parsed element, and drop the siblings parsed before it, so that the
+    tree does not grow as the file is parsed.
+    """
+    elem.clear()
+    while elem.getprevious() is not None:
+        del elem.getparent()[0]
+
+
+def add_fieldname(name):
+    """
+    Add a column to the end of FIELDNAMES. The column names are kept for the
+    whole run, so they are interned.
+    """
+    name = intern(name)
+    SEEN_FIELDNAMES.add(name)
+    FIELDNAMES.append(name)
+
+
+def scan_fieldnames(input_file):
+    """
+    Make a first pass over the SDMX file to collect every concept, in the order
+    it first appears, so that the CSV header is known before any row is written.
+    """
+    for _, elem in etree.iterparse(input_file, tag=('{*}Value', '{*}Series'),
+                                   huge_tree=True):
+        if remove_xml_namespace(elem.tag) == 'Value':
+            attribute_name = elem.attrib['concept']
+            if attribute_name not in SEEN_FIELDNAMES:
+                add_fieldname(attribute_name)
+        clear_element(elem)
+    if 'OBS_VALUE' not in SEEN_FIELDNAMES:
+        add_fieldname('OBS_VALUE')
 
 
-def build_rows(row_array):
+def iter_rows(input_file):
     """
-    Iteratively parse the SDMX file, storing the concept-value pairs and the
-    observed value in a dictionary.
+    Iteratively parse the SDMX file, storing the concept values and the
+    observed value in a list laid out in FIELDNAMES order, and yield each
+    row as soon as it is complete.
     """
-    row = {}
+    column_index = {name: index for index, name in enumerate(FIELDNAMES)}
+    obs_value_index = column_index['OBS_VALUE']
+    width = len(column_index)
+
+    row = [''] * width
+    # Only the elements we read (and the Series that hold them, so they can be
+    # cleared) are reported by the parser.
+    for _, elem in etree.iterparse(
+            input_file, tag=('{*}Value', '{*}ObsValue', '{*}Series'),
+            huge_tree=True):
+        tag_name = remove_xml_namespace(elem.tag)
+        if tag_name == 'Value':
+            attribute_name = elem.attrib['concept']
+            attribute_value = elem.attrib['value']
+            row[column_index[attribute_name]] = attribute_value
+            if attribute_name == 'OBS_STATUS':
+                # In this case, we are actually finished with this row, and
+                # there is no valid value reported (it has been suppressed).
+                yield row
+                row = [''] * width
+        if tag_name == 'ObsValue':
+            row[obs_value_index] = elem.attrib['value']
+            yield row
+            row = [''] * width
+        clear_element(elem)
+
+
+def write_rows(rows):
+    """ Write the rows to a CSV file, consuming them as they are produced. """
+    with open(OUTPUT_FILE_NAME, 'w', newline='',
+              buffering=BUFFER_SIZE) as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(FIELDNAMES)
+        writer.writerows(rows)
+
+
+if ARGS.verbose:
     print(INPUT_FILE)
-    with ARGS.input_file as input_file:
-        for _, elem in cElementTree.iterparse(input_file):
-            tag_name = remove_xml_namespace(elem.tag)
-            if tag_name == 'Value':
-                attribute_name = elem.attrib['concept']
-                attribute_value = elem.attrib['value']
-                row[attribute_name] = attribute_value
-                ORDERED_KEY_DICT[attribute_name] = 1
-                if attribute_name == 'OBS_STATUS':
-                    # In this case, we are actually finished with this row, and
-                    # there is no valid value reported (it has been suppressed).
-                    append_row(row_array, row, None)
-                    row = {}
-            if tag_name == 'ObsValue':
-                append_row(row_array, row, elem.attrib['value'])
-                row = {}
-            elem.clear()
-
-
-def write_rows(row_array):
-    """ Write the rows to a CSV file. """
-    ORDERED_KEY_DICT['OBS_VALUE'] = 1
-    with open(OUTPUT_FILE_NAME, 'w') as output_file:
-        dict_writer = csv.DictWriter(
-            output_file, fieldnames=list(ORDERED_KEY_DICT.keys()))
-        dict_writer.writeheader()
-        dict_writer.writerows(row_array)
-
-
-ROWS = []
-print("Building rows...")
-build_rows(ROWS)
-print("Writing to CSV...")
-write_rows(ROWS)
+with INPUT_FILE as input_file:
+    print("Scanning columns...")
+    scan_fieldnames(input_file)
+    input_file.seek(0)
+    print("Writing to CSV...")
+    write_rows(iter_rows(input_file))
 print("Done.")